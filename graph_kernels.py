@@ -0,0 +1,136 @@
+import threading
+from array import array
+
+
+# Graph walks over a CSR adjacency (see build_csr): the outgoing neighbours of
+# dense node index i are indices[indptr[i]:indptr[i + 1]]. Everything is flat
+# int64 arrays and a byte bitmap, no per-node objects.
+
+def build_csr(node_count, sources, targets):
+    # Counting sort of the (source, target) index pairs by source; stable, so each
+    # node keeps its edges in input order. Returns (indptr, indices).
+    indptr = array("q", [0]) * (node_count + 1)
+    for source in sources:
+        indptr[source + 1] += 1
+    for i in range(node_count):
+        indptr[i + 1] += indptr[i]
+    indices = array("q", [0]) * len(targets)
+    next_slot = indptr[:-1]
+    for source, target in zip(sources, targets):
+        indices[next_slot[source]] = target
+        next_slot[source] += 1
+    return indptr, indices
+
+
+_scratch = threading.local()
+
+
+def _scratch_buffers(size):
+    # A mark bitmap and two parent arrays are kept per thread and reused by every
+    # search. They only grow, and each search resets just the entries it touched,
+    # so a call costs O(nodes visited) rather than O(size).
+    marks = getattr(_scratch, "marks", None)
+    if marks is None:
+        marks = _scratch.marks = bytearray()
+        _scratch.start_parent = array("q")
+        _scratch.end_parent = array("q")
+    start_parent = _scratch.start_parent
+    end_parent = _scratch.end_parent
+    if len(marks) < size:
+        grow = size - len(marks)
+        marks.extend(bytes(grow))
+        start_parent.extend(array("q", [-1]) * grow)
+        end_parent.extend(array("q", [-1]) * grow)
+    return marks, start_parent, end_parent
+
+
+def dfs_reachable(indptr, indices, start):
+    visited, _, _ = _scratch_buffers(len(indptr) - 1)
+    visited[start] = 1
+    stack = array("q", [start])
+    reachable = array("q")
+    try:
+        while stack:
+            node = stack.pop()
+            reachable.append(node)
+            # Push in reverse so neighbours are visited in edge order.
+            for i in range(indptr[node + 1] - 1, indptr[node] - 1, -1):
+                next_node = indices[i]
+                if not visited[next_node]:
+                    visited[next_node] = 1
+                    stack.append(next_node)
+        return reachable
+    finally:
+        # Every marked node is either reachable already or still on the stack.
+        for node in reachable:
+            visited[node] = 0
+        for node in stack:
+            visited[node] = 0
+
+
+_START_SIDE = 1
+_END_SIDE = 2
+
+
+def bidir_bfs_csr(indptr, indices, rev_indptr, rev_indices, start, end, max_length=None):
+    # Shortest path by breadth-first search from both ends at once: forward from
+    # start over (indptr, indices), backward from end over the reverse CSR, always
+    # expanding the smaller frontier, so it visits O(b^(d/2)) nodes instead of
+    # O(b^d). Paths longer than max_length edges are not searched for. Returns an
+    # empty array when no path exists.
+    if start == end:
+        return array("q", [start])
+    side, start_parent, end_parent = _scratch_buffers(len(indptr) - 1)
+    # Each side's seen nodes in BFS order; its frontier is the slice from its head.
+    start_seen = array("q", [start])
+    end_seen = array("q", [end])
+    side[start] = _START_SIDE
+    side[end] = _END_SIDE
+    start_head = end_head = 0
+    length = 0
+    try:
+        while start_head < len(start_seen) and end_head < len(end_seen) and (max_length is None or length < max_length):
+            length += 1
+            if len(start_seen) - start_head <= len(end_seen) - end_head:
+                start_head, meeting_node = _expand_frontier(start_seen, start_head, indptr, indices, side, _START_SIDE, start_parent)
+            else:
+                end_head, meeting_node = _expand_frontier(end_seen, end_head, rev_indptr, rev_indices, side, _END_SIDE, end_parent)
+            if meeting_node != -1:
+                path = array("q")
+                node = meeting_node
+                while node != -1:
+                    path.append(node)
+                    node = start_parent[node]
+                path.reverse()
+                node = end_parent[meeting_node]
+                while node != -1:
+                    path.append(node)
+                    node = end_parent[node]
+                return path
+        return array("q")
+    finally:
+        # Between them the two seen lists hold every node this search touched.
+        for node in start_seen:
+            side[node] = 0
+            start_parent[node] = -1
+        for node in end_seen:
+            side[node] = 0
+            end_parent[node] = -1
+
+
+def _expand_frontier(seen, head, indptr, indices, side, this_side, parent):
+    # Expands the frontier seen[head:] by one level and returns the new head, along
+    # with the first node also reached from the other side (-1 if there is none).
+    tail = len(seen)
+    for k in range(head, tail):
+        node = seen[k]
+        for i in range(indptr[node], indptr[node + 1]):
+            next_node = indices[i]
+            if side[next_node] == this_side:
+                continue
+            parent[next_node] = node
+            seen.append(next_node)
+            if side[next_node]:
+                return tail, next_node
+            side[next_node] = this_side
+    return tail, -1
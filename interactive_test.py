@@ -1,23 +1,19 @@
+import ast
+import json
 from datetime import datetime
-from sqlmodel import Session, create_engine, select
-from models import Tree, TreeVersion, TreeNode, TreeEdge, init_db
-
-sqlite_url = "sqlite:///kastle.db"
-engine = create_engine(sqlite_url)
+from sqlmodel import Session
+from models import Tree, TreeVersion, init_db, engine, walk_subgraph, find_path_between, get_nodes_by_id
 
 def create_sample_tree(session: Session):
     tree = Tree(name="Root Configuration")
+    first_version = TreeVersion(tree=tree, tag="v1.0", description="Initial version")
     session.add(tree)
-    session.commit()
-
-    first_version = TreeVersion(tree_id=tree.id, tag="v1.0", description="Initial version")
-    session.add(first_version)
-    session.commit()
+    session.flush()
 
-    node1 = first_version.add_node(session, data={"setting": "value1"})
-    node2 = first_version.add_node(session, data={"setting": "value2"})
+    node1_id, node2_id = first_version.add_nodes(session, [{"setting": "value1"}, {"setting": "value2"}], commit=False)
 
-    first_version.add_edge(session, node_id_1=node1.id, node_id_2=node2.id, data={"type": "dependency"})
+    first_version.add_edge(session, node_id_1=node1_id, node_id_2=node2_id, data={"type": "dependency"}, commit=False)
+    session.commit()
 
     return tree
 
@@ -37,10 +33,17 @@ def restore_from_tag(session: Session, tree: Tree):
     except ValueError as e:
         print(e)
 
+def parse_data(raw_data: str):
+    # Data is expected as JSON; Python dict literals are still accepted.
+    try:
+        return json.loads(raw_data)
+    except json.JSONDecodeError:
+        return ast.literal_eval(raw_data)
+
 def add_node_and_edge(session: Session, tree: Tree):
-    node_data = input("Enter node data (e.g., {'setting': 'new_value'}): ")
+    node_data = input('Enter node data as JSON (e.g., {"setting": "new_value"}): ')
     try:
-        node_data = eval(node_data) 
+        node_data = parse_data(node_data)
     except Exception as e:
         print(f"Invalid node data: {e}")
         return
@@ -51,9 +54,9 @@ def add_node_and_edge(session: Session, tree: Tree):
 
     node1_id = int(input("Enter the ID of the first node for the edge: "))
     node2_id = int(input("Enter the ID of the second node for the edge: "))
-    edge_data = input("Enter edge data (e.g., {'type': 'dependency'}): ")
+    edge_data = input('Enter edge data as JSON (e.g., {"type": "dependency"}): ')
     try:
-        edge_data = eval(edge_data)  
+        edge_data = parse_data(edge_data)
     except Exception as e:
         print(f"Invalid edge data: {e}")
         return
@@ -63,49 +66,26 @@ def add_node_and_edge(session: Session, tree: Tree):
 
 def traverse_tree(session: Session, tree: Tree):
     node_id = int(input("Enter the node ID to start traversal from: "))
-
-    def traverse_tree_recursive(node_id):
-        node = session.get(TreeNode, node_id)
-        print(f"Node {node.id}: {node.data}")
-        stmt = select(TreeEdge).filter(TreeEdge.incoming_node_id == node.id)
-        edges = session.exec(stmt).all()  
-        for edge in edges:
-            print(f"Edge {edge.id}: {edge.data}")
-            traverse_tree_recursive(edge.outgoing_node_id)
+    latest_version = tree.get_latest_version(session)
 
     print("\nStarting Traversal:")
-    traverse_tree_recursive(node_id)
+    for edge, node in walk_subgraph(session, node_id, latest_version.id):
+        if edge is not None:
+            print(f"Edge {edge.id}: {edge.data}")
+        if node is not None:
+            print(f"Node {node.id}: {node.data}")
 
 def find_path(session: Session, tree: Tree):
     start_node_id = int(input("Enter the starting node ID: "))
     end_node_id = int(input("Enter the ending node ID: "))
+    latest_version = tree.get_latest_version(session)
 
-    def find_path_recursive(start_node_id, end_node_id):
-        visited = set()
-        path = []
-        def dfs(node_id):
-            if node_id in visited:
-                return False
-            visited.add(node_id)
-            path.append(node_id)
-            if node_id == end_node_id:
-                return True
-            stmt = select(TreeEdge).filter(TreeEdge.incoming_node_id == node_id)
-            edges = session.exec(stmt).all()  
-            for edge in edges:
-                if dfs(edge.outgoing_node_id):
-                    return True
-            path.pop()
-            return False
-        
-        dfs(start_node_id)
-        return path
-
-    path = find_path_recursive(start_node_id, end_node_id)
+    path = find_path_between(session, start_node_id, end_node_id, latest_version.id)
     print(f"\nPath found: {path}")
     
+    node_by_id = get_nodes_by_id(session, path)
     for node_id in path:
-        node = session.get(TreeNode, node_id)
+        node = node_by_id[node_id]
         print(f"Node {node.id}: {node.data}")
 
 def interactive_example():
@@ -1,20 +1,38 @@
+from array import array
 from datetime import datetime
-from sqlmodel import SQLModel, Field, create_engine, Session, Relationship
+from sqlmodel import SQLModel, Field, create_engine, Session, Relationship, select
 from typing import Optional, List
-from sqlalchemy import JSON, Column
+import orjson
+from models_lite import NodeRec, EdgeRec
+from graph_kernels import bidir_bfs_csr, build_csr
+from sqlalchemy import Column, DateTime, Index, Text, TypeDecorator, bindparam, event, func, insert, inspect, text
+from sqlalchemy.pool import QueuePool
+
+class OrjsonJSON(TypeDecorator):
+    # JSON column (de)serialized with orjson and stored as plain TEXT, which
+    # skips both the stdlib json module and SQLite's own JSON handling.
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode() if value is not None else None
+
+    def process_result_value(self, value, dialect):
+        return orjson.loads(value) if value is not None else None
+
 
 class Tree(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: Optional[datetime] = Field(default=None, sa_column=Column(DateTime, server_default=func.now(), nullable=False))
 
     versions: List["TreeVersion"] = Relationship(back_populates="tree", sa_relationship_kwargs={"cascade": "all, delete-orphan"})
 
     def get_latest_version(self, session: Session):
-        return session.query(TreeVersion).filter_by(tree_id=self.id).order_by(TreeVersion.created_at.desc()).first()
+        return session.exec(LATEST_VERSION_QUERY, params={"tree_id": self.id}).first()
 
     def get_version_by_tag(self, session: Session, tag: str):
-        return session.query(TreeVersion).filter_by(tree_id=self.id, tag=tag).first()
+        return session.exec(VERSION_BY_TAG_QUERY, params={"tree_id": self.id, "tag": tag}).first()
 
     def create_tag(self, session: Session, tag: str, description: str):
         latest = self.get_latest_version(session)
@@ -43,58 +61,106 @@ class Tree(SQLModel, table=True):
 
 
 class TreeVersion(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_version_tree_created", "tree_id", "created_at"),
+        Index("ix_version_tag", "tree_id", "tag"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     tree_id: int = Field(foreign_key="tree.id")
     parent_version_id: Optional[int] = Field(foreign_key="treeversion.id", default=None)
     tag: Optional[str] = None
     description: Optional[str] = None
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    tag_created_at: Optional[datetime] = Field(default_factory=datetime.utcnow)  # Added tag_created_at
+    created_at: Optional[datetime] = Field(default=None, sa_column=Column(DateTime, server_default=func.now(), nullable=False))
+    tag_created_at: Optional[datetime] = Field(default=None, sa_column=Column(DateTime, server_default=func.now()))  # Added tag_created_at
+    # Highest node/edge id that existed when this version was forked from its
+    # parent; rows the parent gains afterwards are not inherited.
+    base_node_id: Optional[int] = None
+    base_edge_id: Optional[int] = None
 
     tree: "Tree" = Relationship(back_populates="versions")
-    nodes: List["TreeNode"] = Relationship(back_populates="version", sa_relationship_kwargs={"cascade": "all, delete-orphan"})
-    edges: List["TreeEdge"] = Relationship(back_populates="version", sa_relationship_kwargs={"cascade": "all, delete-orphan"})
+    # Only the rows added in this version; use get_nodes/get_edges for everything
+    # the version contains, including what it shares with its ancestors.
+    own_nodes: List["TreeNode"] = Relationship(back_populates="version", sa_relationship_kwargs={"cascade": "all, delete-orphan"})
+    own_edges: List["TreeEdge"] = Relationship(back_populates="version", sa_relationship_kwargs={"cascade": "all, delete-orphan"})
     parent: Optional["TreeVersion"] = Relationship(sa_relationship_kwargs={"remote_side": "TreeVersion.id"})
 
     def create_new_version(self, session: Session, tag: Optional[str] = None, description: Optional[str] = None):
-        new_version = TreeVersion(tree_id=self.tree_id, parent_version_id=self.id, tag=tag, description=description)
+        # Versions share their ancestors' nodes and edges instead of copying them,
+        # so forking only records the id high-water marks and writes one row.
+        # text() statements do not autoflush; pending rows must get their ids first.
+        session.flush()
+        base_node_id, base_edge_id = session.execute(BASE_IDS_QUERY).one()
+        new_version = TreeVersion(tree_id=self.tree_id, parent_version_id=self.id, tag=tag, description=description,
+                                  base_node_id=base_node_id, base_edge_id=base_edge_id)
         session.add(new_version)
-        session.flush()  
-        old_to_new_node = {}
-        for node in self.nodes:
-            new_node = TreeNode(tree_version_id=new_version.id, data=node.data)
-            session.add(new_node)
-            session.flush()
-            old_to_new_node[node.id] = new_node.id
-
-        for edge in self.edges:
-            new_edge = TreeEdge(
-                tree_version_id=new_version.id,
-                incoming_node_id=old_to_new_node[edge.incoming_node_id],
-                outgoing_node_id=old_to_new_node[edge.outgoing_node_id],
-                data=edge.data
-            )
-            session.add(new_edge)
-
         session.commit()
         return new_version
 
-    def add_node(self, session: Session, data: dict):  # Updated to use dict (JSON)
+    def get_nodes(self, session: Session):
+        return session.exec(select(TreeNode).from_statement(VERSION_NODES_QUERY), params={"version_id": self.id}).scalars().all()
+
+    def get_edges(self, session: Session):
+        return session.exec(select(TreeEdge).from_statement(VERSION_EDGES_QUERY), params={"version_id": self.id}).scalars().all()
+
+    def add_node(self, session: Session, data: dict, commit: bool = True):  # Updated to use dict (JSON)
         new_node = TreeNode(tree_version_id=self.id, data=data)
         session.add(new_node)
-        session.commit()
+        session.flush()
+        if commit:
+            session.commit()
         return new_node
 
-    def add_edge(self, session: Session, node_id_1: int, node_id_2: int, data: dict):  # Updated to use dict (JSON)
+    def add_nodes(self, session: Session, data_list: List[dict], commit: bool = True):
+        # Inserts all nodes with one executemany and returns their ids in order.
+        # SQLAlchemy 1.4 has no RETURNING for SQLite, so the ids are read back: with
+        # AUTOINCREMENT they are the newest len(data_list) rows of this version.
+        if not data_list:
+            return []
+        session.execute(insert(TreeNode), [{"tree_version_id": self.id, "data": data} for data in data_list])
+        node_ids = session.exec(NEWEST_NODE_IDS_QUERY, params={"tree_version_id": self.id, "count": len(data_list)}).all()[::-1]
+        if commit:
+            session.commit()
+        return node_ids
+
+    def add_edge(self, session: Session, node_id_1: int, node_id_2: int, data: dict, commit: bool = True):  # Updated to use dict (JSON)
         node1 = session.get(TreeNode, node_id_1)
         node2 = session.get(TreeNode, node_id_2)
         if not node1 or not node2:
             raise ValueError("One or both nodes do not exist in this version")
         new_edge = TreeEdge(tree_version_id=self.id, incoming_node_id=node1.id, outgoing_node_id=node2.id, data=data)
         session.add(new_edge)
-        session.commit()
+        session.flush()
+        if commit:
+            session.commit()
         return new_edge
 
+    def edge_arrays(self, session: Session):
+        # Returns the version's edges as two parallel int64 arrays
+        # (incoming_node_ids, outgoing_node_ids), ordered by edge id.
+        incoming = array("q")
+        outgoing = array("q")
+        for incoming_node_id, outgoing_node_id in session.execute(VERSION_EDGE_ENDPOINTS_QUERY, {"version_id": self.id}):
+            incoming.append(incoming_node_id)
+            outgoing.append(outgoing_node_id)
+        return incoming, outgoing
+
+    def to_csr(self, session: Session):
+        # Returns (indptr, indices, node_ids): the version's edges in CSR form over
+        # dense node indices, with node_ids (ascending) mapping each index back to
+        # its TreeNode id.
+        node_ids = array("q", session.execute(VERSION_NODE_IDS_QUERY, {"version_id": self.id}).scalars())
+        index_of = {node_id: i for i, node_id in enumerate(node_ids)}
+        sources = array("q")
+        targets = array("q")
+        for incoming_node_id, outgoing_node_id in zip(*self.edge_arrays(session)):
+            # Edges touching a node outside this version cannot be indexed; drop them.
+            if incoming_node_id in index_of and outgoing_node_id in index_of:
+                sources.append(index_of[incoming_node_id])
+                targets.append(index_of[outgoing_node_id])
+        indptr, indices = build_csr(len(node_ids), sources, targets)
+        return indptr, indices, node_ids
+
     def get_child_nodes(self, session: Session):
         return session.query(TreeNode).join(TreeEdge).filter(TreeEdge.incoming_node_id == self.id).all()
 
@@ -103,30 +169,257 @@ class TreeVersion(SQLModel, table=True):
 
 
 class TreeNode(SQLModel, table=True):
+    # AUTOINCREMENT keeps ids strictly increasing, which base_node_id relies on.
+    __table_args__ = (Index("ix_node_version", "tree_version_id"), {"sqlite_autoincrement": True})
+
     id: Optional[int] = Field(default=None, primary_key=True)
     tree_version_id: int = Field(foreign_key="treeversion.id")
-    data: dict = Field(sa_column=Column(JSON))  # Corrected to use Column with JSON
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    data: dict = Field(sa_column=Column(OrjsonJSON))
+    created_at: Optional[datetime] = Field(default=None, sa_column=Column(DateTime, server_default=func.now(), nullable=False))
 
-    version: "TreeVersion" = Relationship(back_populates="nodes")
+    version: "TreeVersion" = Relationship(back_populates="own_nodes")
 
 
 class TreeEdge(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_edge_incoming", "incoming_node_id", "tree_version_id"),
+        Index("ix_edge_outgoing", "outgoing_node_id", "tree_version_id"),
+        # get_edges/edge_arrays/to_csr select a version's edges by version alone.
+        Index("ix_edge_version", "tree_version_id"),
+        {"sqlite_autoincrement": True},
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     tree_version_id: int = Field(foreign_key="treeversion.id")
     incoming_node_id: int = Field(foreign_key="treenode.id")
     outgoing_node_id: int = Field(foreign_key="treenode.id")
-    data: dict = Field(sa_column=Column(JSON))  # Corrected to use Column with JSON
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    data: dict = Field(sa_column=Column(OrjsonJSON))
+    created_at: Optional[datetime] = Field(default=None, sa_column=Column(DateTime, server_default=func.now(), nullable=False))
+
+    version: "TreeVersion" = Relationship(back_populates="own_edges")
+
+
+# Statements used on every call are built once; only their parameters change.
+LATEST_VERSION_QUERY = (
+    select(TreeVersion).where(TreeVersion.tree_id == bindparam("tree_id"))
+    # CURRENT_TIMESTAMP has one-second resolution; the id breaks ties.
+    .order_by(TreeVersion.created_at.desc(), TreeVersion.id.desc()).limit(1)
+)
+VERSION_BY_TAG_QUERY = (
+    select(TreeVersion).where(TreeVersion.tree_id == bindparam("tree_id"), TreeVersion.tag == bindparam("tag")).limit(1)
+)
+NEWEST_NODE_IDS_QUERY = (
+    select(TreeNode.id).where(TreeNode.tree_version_id == bindparam("tree_version_id")).order_by(TreeNode.id.desc()).limit(bindparam("count"))
+)
+NODES_BY_ID_QUERY = select(TreeNode).where(TreeNode.id.in_(bindparam("node_ids", expanding=True)))
+CHILD_VERSION_QUERY = select(TreeVersion.id).where(TreeVersion.parent_version_id == bindparam("version_id")).limit(1)
+
+# 0 rather than NULL for an empty table: in the lineage NULL means "every row".
+BASE_IDS_QUERY = text("SELECT COALESCE((SELECT max(id) FROM treenode), 0), COALESCE((SELECT max(id) FROM treeedge), 0)")
+
+# The version :version_id and its ancestors. Each row carries the highest node and
+# edge id of that version visible from :version_id (NULL meaning all of them).
+LINEAGE_CTE = """
+    lineage(version_id, parent_id, max_node_id, max_edge_id, base_node_id, base_edge_id) AS (
+        SELECT id, parent_version_id, NULL, NULL, base_node_id, base_edge_id FROM treeversion WHERE id = :version_id
+        UNION ALL
+        SELECT treeversion.id, treeversion.parent_version_id, lineage.base_node_id, lineage.base_edge_id,
+               treeversion.base_node_id, treeversion.base_edge_id
+        FROM treeversion JOIN lineage ON treeversion.id = lineage.parent_id
+    )"""
 
-    version: "TreeVersion" = Relationship(back_populates="edges")
+VISIBLE_NODE = "(lineage.version_id = treenode.tree_version_id AND (lineage.max_node_id IS NULL OR treenode.id <= lineage.max_node_id))"
+VISIBLE_EDGE = "EXISTS (SELECT 1 FROM lineage WHERE lineage.version_id = treeedge.tree_version_id AND (lineage.max_edge_id IS NULL OR treeedge.id <= lineage.max_edge_id))"
 
+VERSION_NODES_QUERY = text(f"""
+    WITH RECURSIVE {LINEAGE_CTE}
+    SELECT treenode.* FROM treenode JOIN lineage ON {VISIBLE_NODE}
+    ORDER BY treenode.id
+""")
+
+VERSION_EDGES_QUERY = text(f"""
+    WITH RECURSIVE {LINEAGE_CTE}
+    SELECT treeedge.* FROM treeedge JOIN lineage ON lineage.version_id = treeedge.tree_version_id
+    WHERE lineage.max_edge_id IS NULL OR treeedge.id <= lineage.max_edge_id
+    ORDER BY treeedge.id
+""")
+
+VERSION_NODE_IDS_QUERY = text(f"""
+    WITH RECURSIVE {LINEAGE_CTE}
+    SELECT treenode.id FROM treenode JOIN lineage ON {VISIBLE_NODE}
+    ORDER BY treenode.id
+""")
+
+VERSION_EDGE_ENDPOINTS_QUERY = text(f"""
+    WITH RECURSIVE {LINEAGE_CTE}
+    SELECT treeedge.incoming_node_id, treeedge.outgoing_node_id FROM treeedge JOIN lineage ON lineage.version_id = treeedge.tree_version_id
+    WHERE lineage.max_edge_id IS NULL OR treeedge.id <= lineage.max_edge_id
+    ORDER BY treeedge.id
+""")
+
+# Walks the version's edges outward from :start_node_id in a single recursive
+# query and returns one row per (reachable node, outgoing edge) pair:
+# (node_id, node_data, edge_id, outgoing_node_id, edge_data). No rows if the
+# start node is not in the version.
+SUBGRAPH_SQL = f"""
+    WITH RECURSIVE {LINEAGE_CTE},
+    walk(node_id) AS (
+        SELECT treenode.id FROM treenode JOIN lineage ON {VISIBLE_NODE} WHERE treenode.id = :start_node_id
+        UNION
+        SELECT treeedge.outgoing_node_id FROM treeedge JOIN walk ON treeedge.incoming_node_id = walk.node_id
+        WHERE {VISIBLE_EDGE}
+    )
+    SELECT treenode.id, treenode.data, treeedge.id, treeedge.outgoing_node_id, treeedge.data
+    FROM walk
+    JOIN treenode ON treenode.id = walk.node_id
+    LEFT JOIN treeedge ON treeedge.incoming_node_id = walk.node_id AND {VISIBLE_EDGE}
+    ORDER BY treenode.id, treeedge.id
+"""
+
+
+# Child versions read their ancestors' nodes and edges through the lineage, so
+# deleting a version (and with it, through the cascade, its own nodes and edges)
+# is refused while it still has children.
+@event.listens_for(TreeVersion, "before_delete")
+def refuse_deleting_shared_version(mapper, connection, target):
+    if connection.execute(CHILD_VERSION_QUERY, {"version_id": target.id}).first():
+        raise ValueError(f"Version {target.id} has child versions that share its nodes and edges")
+
+
+# Runs the subgraph query straight on the session's DBAPI connection (so it sees
+# the session's uncommitted rows) and returns plain tuples. Data columns are left
+# as JSON text; callers decode them only if they need them.
+def raw_traverse(session: Session, start_node_id: int, version_id: int):
+    session.flush()
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.execute(SUBGRAPH_SQL, {"start_node_id": start_node_id, "version_id": version_id})
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def traverse_subgraph(session: Session, start_node_id: int, version_id: int):
+    # nodes: {node_id: NodeRec}, adjacency: {node_id: [EdgeRec, ...]}
+    nodes = {}
+    adjacency = {}
+    for node_id, node_data, edge_id, outgoing_node_id, edge_data in raw_traverse(session, start_node_id, version_id):
+        if node_id not in nodes:
+            nodes[node_id] = NodeRec(node_id, orjson.loads(node_data) if node_data is not None else None)
+            adjacency[node_id] = []
+        if edge_id is not None:
+            adjacency[node_id].append(EdgeRec(edge_id, node_id, outgoing_node_id, orjson.loads(edge_data) if edge_data is not None else None))
+    return nodes, adjacency
+
+
+# Depth-first walk of the subgraph reachable from start_node_id, following each
+# node's edges in id order. Yields (None, start node) first, then an (edge, node)
+# pair per edge followed, with node None when the edge leads back to a node
+# already visited. Yields nothing if the start node is not in the version.
+def walk_subgraph(session: Session, start_node_id: int, version_id: int):
+    nodes, adjacency = traverse_subgraph(session, start_node_id, version_id)
+    if start_node_id not in nodes:
+        return
+    yield None, nodes[start_node_id]
+    visited = {start_node_id}
+    stack = [iter(adjacency[start_node_id])]
+    while stack:
+        edge = next(stack[-1], None)
+        if edge is None:
+            stack.pop()
+            continue
+        if edge.outgoing in visited:
+            yield edge, None
+            continue
+        visited.add(edge.outgoing)
+        yield edge, nodes[edge.outgoing]
+        stack.append(iter(adjacency[edge.outgoing]))
+
+
+# Loads the given nodes with a single IN query (also seeding the identity map)
+# and returns them keyed by id.
+def get_nodes_by_id(session: Session, node_ids):
+    if not node_ids:
+        return {}
+    nodes = session.exec(NODES_BY_ID_QUERY, params={"node_ids": list(node_ids)}).all()
+    return {node.id: node for node in nodes}
+
+
+# Shortest path between two nodes of a version: fetches the subgraph reachable
+# from the start node, lays it out as forward and reverse CSR arrays over dense
+# indices, and runs a bidirectional BFS over them (graph_kernels.bidir_bfs_csr).
+# Paths longer than max_length edges are not searched for. Returns [] when no path exists.
+def find_path_between(session: Session, start_node_id: int, end_node_id: int, version_id: int, max_length: Optional[int] = None):
+    # Only the shape of the graph matters here, so node and edge data stay undecoded.
+    rows = raw_traverse(session, start_node_id, version_id)
+    node_ids = array("q")
+    index_of = {}
+    for node_id, _, _, _, _ in rows:
+        if node_id not in index_of:
+            index_of[node_id] = len(node_ids)
+            node_ids.append(node_id)
+    # The end must be reachable. With no rows (the start node is not in this
+    # version) nothing is, so not even start == end gets a path.
+    if end_node_id not in index_of:
+        return []
+    sources = array("q")
+    targets = array("q")
+    for node_id, _, edge_id, outgoing_node_id, _ in rows:
+        if edge_id is not None:
+            sources.append(index_of[node_id])
+            targets.append(index_of[outgoing_node_id])
+    indptr, indices = build_csr(len(node_ids), sources, targets)
+    rev_indptr, rev_indices = build_csr(len(node_ids), targets, sources)
+    path = bidir_bfs_csr(indptr, indices, rev_indptr, rev_indices, index_of[start_node_id], index_of[end_node_id], max_length)
+    return [node_ids[i] for i in path]
 
 sqlite_url = "sqlite:///kastle.db"
-engine = create_engine(sqlite_url)
+# SQLAlchemy 1.4 defaults file-backed SQLite to NullPool, which would reopen the
+# connection (and rerun the pragmas, losing its page cache) on every checkout.
+engine = create_engine(sqlite_url, connect_args={"check_same_thread": False}, poolclass=QueuePool, pool_pre_ping=True)
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+)
+
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+# Databases created before versions shared rows have no base_node_id/base_edge_id,
+# no server default for created_at, no AUTOINCREMENT and none of the indexes, and
+# create_all does not alter existing tables. Rebuild every table from the current
+# models and copy the rows over. Each forked version there holds full copies of its
+# parent's rows, so it gets watermarks of 0 and inherits nothing.
+def upgrade_db(connection):
+    inspector = inspect(connection)
+    if not inspector.has_table("treeversion"):
+        return
+    if "base_node_id" in {column["name"] for column in inspector.get_columns("treeversion")}:
+        return
+    tables = SQLModel.metadata.sorted_tables
+    old_columns = {table.name: {column["name"] for column in inspector.get_columns(table.name)} for table in tables}
+    for table in tables:
+        connection.exec_driver_sql(f"ALTER TABLE {table.name} RENAME TO {table.name}_old")
+    SQLModel.metadata.create_all(connection)
+    for table in tables:
+        columns = ", ".join(column.name for column in table.columns if column.name in old_columns[table.name])
+        connection.exec_driver_sql(f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {table.name}_old")
+    connection.exec_driver_sql("UPDATE treeversion SET base_node_id = 0, base_edge_id = 0 WHERE parent_version_id IS NOT NULL")
+    for table in reversed(tables):
+        connection.exec_driver_sql(f"DROP TABLE {table.name}_old")
 
 def init_db():
-    SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        upgrade_db(connection)
+        SQLModel.metadata.create_all(connection)
 
 if __name__ == "__main__":
     init_db()
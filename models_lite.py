@@ -0,0 +1,21 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+# Lightweight in-memory records for traversal results. They use __slots__ (no
+# per-instance __dict__); node/edge data is decoded once when the record is built.
+
+@dataclass(frozen=True)
+class NodeRec:
+    __slots__ = ("id", "data")
+    id: int
+    data: Optional[dict]
+
+
+@dataclass(frozen=True)
+class EdgeRec:
+    __slots__ = ("id", "incoming", "outgoing", "data")
+    id: int
+    incoming: int
+    outgoing: int
+    data: Optional[dict]
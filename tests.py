@@ -1,17 +1,17 @@
 import pytest
-from sqlmodel import Session, create_engine, SQLModel, select  
-from models import Tree, TreeVersion, TreeNode, TreeEdge, init_db
+from array import array
+from sqlmodel import Session, SQLModel, select  
+from models import Tree, TreeVersion, TreeNode, TreeEdge, init_db, engine, raw_traverse, traverse_subgraph, walk_subgraph, find_path_between, get_nodes_by_id
+from graph_kernels import build_csr, dfs_reachable, bidir_bfs_csr
 
 
-test_engine = create_engine("sqlite:///kastle.db")
-
 @pytest.fixture(scope="function")
 def session():
     """Fixture to create a fresh database session for each test."""
-    SQLModel.metadata.create_all(test_engine)
-    with Session(test_engine) as session:
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
         yield session
-    SQLModel.metadata.drop_all(test_engine)
+    SQLModel.metadata.drop_all(engine)
 
 def run_test(test_name, test_func, session):
     try:
@@ -52,6 +52,22 @@ def test_create_multiple_versions(session):
     assert versions[0].tag == "v1.0"
     assert versions[1].tag == "v1.1"
 
+#  Test for picking the latest version when timestamps are equal
+def test_get_latest_version(session):
+    tree = Tree(name="Latest Version Test Tree")
+    session.add(tree)
+    session.commit()
+    assert tree.created_at is not None
+
+    version = TreeVersion(tree_id=tree.id, tag="v1.0", description="Initial version")
+    session.add(version)
+    session.commit()
+    assert version.created_at is not None
+
+    # Versions created within the same second share a CURRENT_TIMESTAMP.
+    newest = version.create_new_version(session, tag="v1.1").create_new_version(session, tag="v1.2")
+    assert tree.get_latest_version(session).id == newest.id
+
 #  Test for adding nodes and edges
 def test_add_nodes_and_edges(session):
     tree = Tree(name="Node Edge Test Tree")
@@ -70,6 +86,72 @@ def test_add_nodes_and_edges(session):
     edge = version.add_edge(session, node1.id, node2.id, data={"relation": "connected"})
     assert edge.id is not None
 
+#  Test for storing and reading back node and edge data
+def test_data_round_trip(session):
+    tree = Tree(name="Data Round Trip Test Tree")
+    session.add(tree)
+    session.commit()
+
+    version = TreeVersion(tree_id=tree.id, tag="v1.0", description="Testing data round trip")
+    session.add(version)
+    session.commit()
+
+    data = {"setting": "välue", "nested": {"list": [1, 2.5, None, True]}}
+    node1 = version.add_node(session, data=data)
+    node2 = version.add_node(session, data={})
+    edge = version.add_edge(session, node1.id, node2.id, data={1: "int key"})
+    session.expire_all()
+
+    assert session.get(TreeNode, node1.id).data == data
+    assert session.get(TreeNode, node2.id).data == {}
+    assert session.get(TreeEdge, edge.id).data == {"1": "int key"}
+
+#  Test for bulk-adding nodes
+def test_add_nodes(session):
+    tree = Tree(name="Bulk Node Test Tree")
+    session.add(tree)
+    session.commit()
+
+    version = TreeVersion(tree_id=tree.id, tag="v1.0", description="Testing bulk inserts")
+    session.add(version)
+    session.commit()
+
+    existing = version.add_node(session, data={"key": "existing"})
+    node_ids = version.add_nodes(session, [{"key": "value1"}, {"key": "value2"}, {"key": "value3"}])
+    assert version.add_nodes(session, []) == []
+
+    assert len(node_ids) == 3
+    assert existing.id not in node_ids
+    assert [session.get(TreeNode, node_id).data for node_id in node_ids] == [{"key": "value1"}, {"key": "value2"}, {"key": "value3"}]
+    assert all(session.get(TreeNode, node_id).created_at is not None for node_id in node_ids)
+
+#  Test for batching node and edge inserts into one transaction
+def test_add_nodes_and_edges_without_commit(session):
+    tree = Tree(name="Batched Node Edge Test Tree")
+    session.add(tree)
+    session.commit()
+
+    version = TreeVersion(tree_id=tree.id, tag="v1.0", description="Testing batched inserts")
+    session.add(version)
+    session.commit()
+
+    node1 = version.add_node(session, data={"key": "value1"}, commit=False)
+    node2 = version.add_node(session, data={"key": "value2"}, commit=False)
+    edge = version.add_edge(session, node1.id, node2.id, data={"relation": "connected"}, commit=False)
+    assert node1.id is not None
+    assert node2.id is not None
+    assert edge.id is not None
+
+    session.rollback()
+    assert session.exec(select(TreeNode).filter(TreeNode.tree_version_id == version.id)).all() == []
+
+    node1 = version.add_node(session, data={"key": "value1"}, commit=False)
+    node2 = version.add_node(session, data={"key": "value2"}, commit=False)
+    version.add_edge(session, node1.id, node2.id, data={"relation": "connected"}, commit=False)
+    session.commit()
+    assert len(session.exec(select(TreeNode).filter(TreeNode.tree_version_id == version.id)).all()) == 2
+    assert len(session.exec(select(TreeEdge).filter(TreeEdge.tree_version_id == version.id)).all()) == 1
+
 #  Test for creating and restoring tags
 def test_create_and_restore_tag(session):
     tree = Tree(name="Tag Restore Test Tree")
@@ -111,7 +193,148 @@ def test_create_and_restore_tag(session):
     assert restored_version_recheck is not None, "Restored version should be present in the database after restore"
     assert restored_version_recheck.tag == "release-v1.0", f"Restored version tag mismatch, expected 'release-v1.0', got '{restored_version_recheck.tag}'"
 
+#  Test for sharing nodes and edges between a version and its parent
+def test_create_new_version_shares_nodes_and_edges(session):
+    tree = Tree(name="Version Sharing Test Tree")
+    session.add(tree)
+    session.commit()
+
+    version = TreeVersion(tree_id=tree.id, tag="v1.0", description="Original version")
+    session.add(version)
+    session.commit()
+
+    node1 = version.add_node(session, data={"setting": "value1"})
+    node2 = version.add_node(session, data={"setting": "value2"})
+    edge1 = version.add_edge(session, node1.id, node2.id, data={"type": "dependency"})
+
+    new_version = version.create_new_version(session, tag="v1.1", description="Forked version")
+    assert new_version.own_nodes == []
+    assert new_version.own_edges == []
+    assert [node.id for node in new_version.get_nodes(session)] == [node1.id, node2.id]
+    assert [edge.id for edge in new_version.get_edges(session)] == [edge1.id]
+
+    # Additions on either side of the fork stay on that side.
+    node3 = new_version.add_node(session, data={"setting": "value3"})
+    edge2 = new_version.add_edge(session, node2.id, node3.id, data={"type": "path"})
+    late_node = version.add_node(session, data={"setting": "late"})
+    late_edge = version.add_edge(session, node1.id, late_node.id, data={"type": "late"})
+
+    assert [node.id for node in version.get_nodes(session)] == [node1.id, node2.id, late_node.id]
+    assert [edge.id for edge in version.get_edges(session)] == [edge1.id, late_edge.id]
+    assert [node.id for node in new_version.get_nodes(session)] == [node1.id, node2.id, node3.id]
+    assert [edge.id for edge in new_version.get_edges(session)] == [edge1.id, edge2.id]
+    assert find_path_between(session, node1.id, node3.id, new_version.id) == [node1.id, node2.id, node3.id]
+    assert find_path_between(session, node1.id, node3.id, version.id) == []
+
+    grandchild = new_version.create_new_version(session)
+    assert [node.id for node in grandchild.get_nodes(session)] == [node1.id, node2.id, node3.id]
+    assert [edge.id for edge in grandchild.get_edges(session)] == [edge1.id, edge2.id]
+
+#  Test for forking a version before any nodes or edges exist
+def test_create_new_version_from_empty_tables(session):
+    tree = Tree(name="Empty Fork Test Tree")
+    session.add(tree)
+    session.commit()
+
+    version = TreeVersion(tree_id=tree.id, tag="v1.0", description="Original version")
+    session.add(version)
+    session.commit()
+
+    empty_fork = version.create_new_version(session, tag="v1.1", description="Forked before any nodes")
+    node1 = version.add_node(session, data={"setting": "value1"})
+    node2 = version.add_node(session, data={"setting": "value2"})
+    assert empty_fork.get_nodes(session) == []
+
+    edgeless_fork = version.create_new_version(session, tag="v1.2", description="Forked before any edges")
+    version.add_edge(session, node1.id, node2.id, data={"type": "dependency"})
+    assert [node.id for node in edgeless_fork.get_nodes(session)] == [node1.id, node2.id]
+    assert edgeless_fork.get_edges(session) == []
+    assert find_path_between(session, node1.id, node2.id, edgeless_fork.id) == []
+    assert find_path_between(session, node1.id, node2.id, version.id) == [node1.id, node2.id]
+
+#  Test for forking a version with nodes and edges that are not yet flushed
+def test_create_new_version_with_pending_rows(session):
+    tree = Tree(name="Pending Fork Test Tree")
+    session.add(tree)
+    session.commit()
+
+    version = TreeVersion(tree_id=tree.id, tag="v1.0", description="Original version")
+    session.add(version)
+    session.commit()
+
+    node1 = version.add_node(session, data={"setting": "value1"}, commit=False)
+    node2 = TreeNode(tree_version_id=version.id, data={"setting": "value2"})
+    session.add(node2)
+    new_version = version.create_new_version(session, tag="v1.1")
+    assert [node.id for node in new_version.get_nodes(session)] == [node1.id, node2.id]
+
+    edge = TreeEdge(tree_version_id=version.id, incoming_node_id=node1.id, outgoing_node_id=node2.id, data={"type": "dependency"})
+    session.add(edge)
+    newest_version = version.create_new_version(session, tag="v1.2")
+    assert [edge.id for edge in newest_version.get_edges(session)] == [edge.id]
+
+#  Test for refusing to delete a version that child versions share rows with
+def test_delete_version_with_children(session):
+    tree = Tree(name="Delete Version Test Tree")
+    session.add(tree)
+    session.commit()
+
+    version = TreeVersion(tree_id=tree.id, tag="v1.0", description="Original version")
+    session.add(version)
+    session.commit()
+
+    node1 = version.add_node(session, data={"setting": "value1"})
+    node2 = version.add_node(session, data={"setting": "value2"})
+    version.add_edge(session, node1.id, node2.id, data={"type": "dependency"})
+    new_version = version.create_new_version(session, tag="v1.1")
 
+    session.delete(version)
+    with pytest.raises(ValueError):
+        session.commit()
+    session.rollback()
+    assert [node.id for node in new_version.get_nodes(session)] == [node1.id, node2.id]
+    assert len(new_version.get_edges(session)) == 1
+
+    # Leaf versions can go, and so can a whole tree with its versions.
+    session.delete(new_version)
+    session.commit()
+    assert session.get(TreeVersion, new_version.id) is None
+    version.create_new_version(session, tag="v1.2")
+    session.delete(tree)
+    session.commit()
+    assert session.exec(select(TreeVersion).filter(TreeVersion.tree_id == tree.id)).all() == []
+    assert session.exec(select(TreeNode)).all() == []
+
+#  Test for upgrading a database created before versions shared rows
+def test_upgrade_db(session):
+    SQLModel.metadata.drop_all(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE tree (id INTEGER NOT NULL, name VARCHAR NOT NULL, created_at DATETIME NOT NULL, PRIMARY KEY (id))")
+        connection.exec_driver_sql("CREATE TABLE treeversion (id INTEGER NOT NULL, tree_id INTEGER NOT NULL, parent_version_id INTEGER, tag VARCHAR, description VARCHAR, created_at DATETIME NOT NULL, tag_created_at DATETIME, PRIMARY KEY (id))")
+        connection.exec_driver_sql("CREATE TABLE treenode (data JSON, id INTEGER NOT NULL, tree_version_id INTEGER NOT NULL, created_at DATETIME NOT NULL, PRIMARY KEY (id))")
+        connection.exec_driver_sql("CREATE TABLE treeedge (data JSON, id INTEGER NOT NULL, tree_version_id INTEGER NOT NULL, incoming_node_id INTEGER NOT NULL, outgoing_node_id INTEGER NOT NULL, created_at DATETIME NOT NULL, PRIMARY KEY (id))")
+        connection.exec_driver_sql("INSERT INTO tree VALUES (1, 'Old Tree', '2024-01-01 00:00:00')")
+        connection.exec_driver_sql("INSERT INTO treeversion VALUES (1, 1, NULL, 'v1.0', NULL, '2024-01-01 00:00:00', NULL), (2, 1, 1, NULL, NULL, '2024-01-02 00:00:00', NULL)")
+        # The copying fork gave version 2 its own copies of version 1's rows.
+        connection.exec_driver_sql("""INSERT INTO treenode VALUES ('{"setting": "value1"}', 1, 1, '2024-01-01 00:00:00'), ('{"setting": "value2"}', 2, 1, '2024-01-01 00:00:00'), ('{"setting": "value1"}', 3, 2, '2024-01-02 00:00:00'), ('{"setting": "value2"}', 4, 2, '2024-01-02 00:00:00')""")
+        connection.exec_driver_sql("""INSERT INTO treeedge VALUES ('{"type": "dependency"}', 1, 1, 1, 2, '2024-01-01 00:00:00'), ('{"type": "dependency"}', 2, 2, 3, 4, '2024-01-02 00:00:00')""")
+
+    init_db()
+    init_db()
+
+    tree = session.get(Tree, 1)
+    version1, version2 = session.get(TreeVersion, 1), session.get(TreeVersion, 2)
+    assert [node.id for node in version1.get_nodes(session)] == [1, 2]
+    assert [node.id for node in version2.get_nodes(session)] == [3, 4]
+    assert [edge.id for edge in version2.get_edges(session)] == [2]
+    assert version2.get_nodes(session)[0].data == {"setting": "value1"}
+    assert find_path_between(session, 3, 4, version2.id) == [3, 4]
+
+    # New rows get server-side timestamps and forks share rows as usual.
+    new_node = version2.add_node(session, data={"setting": "value3"})
+    assert new_node.id == 5 and new_node.created_at is not None
+    new_version = tree.create_tag(session, tag="v2.0", description="After upgrade")
+    assert [node.id for node in new_version.get_nodes(session)] == [3, 4, 5]
 
 #  Test for traversing the tree
 def test_traversal(session):
@@ -125,19 +348,80 @@ def test_traversal(session):
 
     node1 = version.add_node(session, data={"setting": "value1"})
     node2 = version.add_node(session, data={"setting": "value2"})
-    version.add_edge(session, node1.id, node2.id, data={"type": "dependency"})
+    edge1 = version.add_edge(session, node1.id, node2.id, data={"type": "dependency"})
+    edge2 = version.add_edge(session, node2.id, node1.id, data={"type": "cycle"})
 
     print("\nStarting Traversal from node 1:")
-    def traverse_tree(node_id):
-        node = session.get(TreeNode, node_id)
-        print(f"Node {node.id}: {node.data}")
-        stmt = select(TreeEdge).filter(TreeEdge.incoming_node_id == node.id)
-        edges = session.exec(stmt).all()  # Using session.exec() instead of session.query()
-        for edge in edges:
+    steps = []
+    for edge, node in walk_subgraph(session, node1.id, version.id):
+        if edge is not None:
             print(f"Edge {edge.id}: {edge.data}")
-            traverse_tree(edge.outgoing_node_id)
+        if node is not None:
+            print(f"Node {node.id}: {node.data}")
+        steps.append((edge.id if edge else None, node.id if node else None))
+    assert steps == [(None, node1.id), (edge1.id, node2.id), (edge2.id, None)]
+    assert list(walk_subgraph(session, node1.id + 100, version.id)) == []
+
+    # Nodes of another tree's version are not part of this one.
+    other_tree = Tree(name="Other Traversal Test Tree")
+    session.add(other_tree)
+    session.commit()
+    other_version = TreeVersion(tree_id=other_tree.id, tag="v1.0", description="Other version")
+    session.add(other_version)
+    session.commit()
+    other_node = other_version.add_node(session, data={"setting": "other"})
+    assert list(walk_subgraph(session, other_node.id, version.id)) == []
+    assert raw_traverse(session, other_node.id, version.id) == []
+    assert [node.id for _, node in walk_subgraph(session, other_node.id, other_version.id)] == [other_node.id]
+
+#  Test for fetching a reachable subgraph containing a cycle
+def test_traverse_subgraph(session):
+    tree = Tree(name="Subgraph Test Tree")
+    session.add(tree)
+    session.commit()
+
+    version = TreeVersion(tree_id=tree.id, tag="v1.0", description="Test subgraph")
+    session.add(version)
+    session.commit()
+
+    node1 = version.add_node(session, data={"setting": "value1"})
+    node2 = version.add_node(session, data={"setting": "value2"})
+    node3 = version.add_node(session, data={"setting": "value3"})
+    unreachable = version.add_node(session, data={"setting": "unreachable"})
+    edge1 = version.add_edge(session, node1.id, node2.id, data={"type": "dependency"})
+    edge2 = version.add_edge(session, node2.id, node3.id, data={"type": "path"})
+    edge3 = version.add_edge(session, node3.id, node1.id, data={"type": "cycle"})
+
+    nodes, adjacency = traverse_subgraph(session, node2.id, version.id)
+    assert {node_id: node.data for node_id, node in nodes.items()} == {node1.id: {"setting": "value1"}, node2.id: {"setting": "value2"}, node3.id: {"setting": "value3"}}
+    assert unreachable.id not in adjacency
+    assert [(e.id, e.incoming, e.outgoing, e.data) for e in adjacency[node1.id]] == [(edge1.id, node1.id, node2.id, {"type": "dependency"})]
+    assert [(e.id, e.incoming, e.outgoing, e.data) for e in adjacency[node2.id]] == [(edge2.id, node2.id, node3.id, {"type": "path"})]
+    assert [(e.id, e.incoming, e.outgoing, e.data) for e in adjacency[node3.id]] == [(edge3.id, node3.id, node1.id, {"type": "cycle"})]
+    assert not hasattr(nodes[node1.id], "__dict__")
+    # Data is decoded once, when the record is built, not on every access.
+    assert nodes[node1.id].data is nodes[node1.id].data
+
+#  Test for reading the raw subgraph rows inside an open transaction
+def test_raw_traverse(session):
+    tree = Tree(name="Raw Traverse Test Tree")
+    session.add(tree)
+    session.commit()
 
-    traverse_tree(node1.id)
+    version = TreeVersion(tree_id=tree.id, tag="v1.0", description="Test raw traversal")
+    session.add(version)
+    session.commit()
+
+    node1 = version.add_node(session, data={"setting": "value1"}, commit=False)
+    node2 = version.add_node(session, data={"setting": "value2"}, commit=False)
+    edge = version.add_edge(session, node1.id, node2.id, data={"type": "dependency"}, commit=False)
+
+    rows = raw_traverse(session, node1.id, version.id)
+    assert rows == [
+        (node1.id, '{"setting":"value1"}', edge.id, node2.id, '{"type":"dependency"}'),
+        (node2.id, '{"setting":"value2"}', None, None, None),
+    ]
+    assert find_path_between(session, node1.id, node2.id, version.id) == [node1.id, node2.id]
 
 #  Test for finding a path between two nodes
 def test_find_path(session):
@@ -156,42 +440,133 @@ def test_find_path(session):
     version.add_edge(session, node2.id, node3.id, data={"type": "path"})
 
     print("\nFinding path from node 1 to node 3:")
-    def find_path(start_node_id, end_node_id):
-        visited = set()
-        path = []
-        def dfs(node_id):
-            if node_id in visited:
-                return False
-            visited.add(node_id)
-            path.append(node_id)
-            if node_id == end_node_id:
-                return True
-            stmt = select(TreeEdge).filter(TreeEdge.incoming_node_id == node_id)
-            edges = session.exec(stmt).all()
-            for edge in edges:
-                if dfs(edge.outgoing_node_id):
-                    return True
-            path.pop()
-            return False
-        
-        dfs(start_node_id)
-        return path
-
-    path = find_path(node1.id, node3.id)
+    path = find_path_between(session, node1.id, node3.id, version.id)
     print(f"Path found: {path}")
+    assert path == [node1.id, node2.id, node3.id]
 
     
+    node_by_id = get_nodes_by_id(session, path)
     for node_id in path:
-        node = session.get(TreeNode, node_id)
+        node = node_by_id[node_id]
         print(f"Node {node.id}: {node.data}")
+    assert [node_by_id[node_id].data for node_id in path] == [{"setting": "value1"}, {"setting": "value2"}, {"setting": "value3"}]
+
+
+#  Test for bounding the path length when finding a path
+def test_find_path_max_length(session):
+    tree = Tree(name="Bounded Pathfinding Test Tree")
+    session.add(tree)
+    session.commit()
+
+    version = TreeVersion(tree_id=tree.id, tag="v1.0", description="Test bounded pathfinding")
+    session.add(version)
+    session.commit()
+
+    a, b, c, x, y, d = (version.add_node(session, data={"setting": name}, commit=False) for name in "abcxyd")
+    for incoming, outgoing in [(a, b), (b, c), (c, x), (x, y), (y, d), (a, c)]:
+        version.add_edge(session, incoming.id, outgoing.id, data={"type": "path"}, commit=False)
+    session.commit()
+
+    assert find_path_between(session, a.id, d.id, version.id) == [a.id, c.id, x.id, y.id, d.id]
+    assert find_path_between(session, a.id, d.id, version.id, max_length=4) == [a.id, c.id, x.id, y.id, d.id]
+    assert find_path_between(session, b.id, d.id, version.id, max_length=4) == [b.id, c.id, x.id, y.id, d.id]
+    assert find_path_between(session, a.id, d.id, version.id, max_length=3) == []
+    assert find_path_between(session, d.id, a.id, version.id) == []
+    assert find_path_between(session, a.id, a.id, version.id) == [a.id]
+    assert find_path_between(session, d.id + 100, d.id + 100, version.id) == []
+
+
+#  Test for bidirectional BFS on CSR arrays
+def test_bidir_bfs():
+    # Node ids double as dense indices here; 0 and 8 have no edges.
+    edges = [(1, 2), (1, 3), (2, 4), (3, 5), (4, 6), (5, 6), (6, 7), (7, 1)]
+    sources = array("q", [incoming for incoming, _ in edges])
+    targets = array("q", [outgoing for _, outgoing in edges])
+    indptr, indices = build_csr(9, sources, targets)
+    rev_indptr, rev_indices = build_csr(9, targets, sources)
+
+    def bidir_bfs(start, end, max_length=None):
+        return list(bidir_bfs_csr(indptr, indices, rev_indptr, rev_indices, start, end, max_length))
+
+    assert bidir_bfs(1, 1) == [1]
+    assert bidir_bfs(1, 2) == [1, 2]
+    assert bidir_bfs(1, 7) == [1, 2, 4, 6, 7]
+    assert bidir_bfs(5, 3) == [5, 6, 7, 1, 3]
+    assert bidir_bfs(1, 7, max_length=3) == []
+    assert bidir_bfs(1, 8) == []
+    # The scratch buffers are shared between calls; repeated searches must not see stale marks.
+    assert bidir_bfs(1, 7) == [1, 2, 4, 6, 7]
+    assert bidir_bfs(5, 3) == [5, 6, 7, 1, 3]
+
+#  Test for walking a version's CSR adjacency
+def test_csr_kernels(session):
+    tree = Tree(name="CSR Test Tree")
+    session.add(tree)
+    session.commit()
+
+    version = TreeVersion(tree_id=tree.id, tag="v1.0", description="Test CSR kernels")
+    session.add(version)
+    session.commit()
+
+    a, b, c, d, e = (version.add_node(session, data={"setting": name}, commit=False) for name in "abcde")
+    for incoming, outgoing in [(a, b), (a, c), (c, d), (d, a)]:
+        version.add_edge(session, incoming.id, outgoing.id, data={"type": "path"}, commit=False)
+    session.commit()
 
+    incoming, outgoing = version.edge_arrays(session)
+    assert list(incoming) == [a.id, a.id, c.id, d.id]
+    assert list(outgoing) == [b.id, c.id, d.id, a.id]
+
+    indptr, indices, node_ids = version.to_csr(session)
+    assert list(node_ids) == [a.id, b.id, c.id, d.id, e.id]
+    assert list(indptr) == [0, 2, 2, 3, 4, 4]
+    assert list(indices) == [1, 2, 3, 0]
+
+    sources = array("q", (i for i in range(len(node_ids)) for _ in range(indptr[i], indptr[i + 1])))
+    rev_indptr, rev_indices = build_csr(len(node_ids), indices, sources)
+    assert list(rev_indptr) == [0, 1, 2, 3, 4, 4]
+    assert list(rev_indices) == [3, 0, 0, 2]
+
+    def find_path(start, end):
+        return [node_ids[i] for i in bidir_bfs_csr(indptr, indices, rev_indptr, rev_indices, start, end)]
+
+    assert [node_ids[i] for i in dfs_reachable(indptr, indices, 0)] == [a.id, b.id, c.id, d.id]
+    assert [node_ids[i] for i in dfs_reachable(indptr, indices, 4)] == [e.id]
+    assert find_path(1, 1) == [b.id]
+    assert find_path(2, 1) == [c.id, d.id, a.id, b.id]
+    assert find_path(1, 0) == []
+
+    # The scratch buffers are shared between calls; repeated searches, on this
+    # graph or a larger one, must not see stale marks.
+    for _ in range(2):
+        assert [node_ids[i] for i in dfs_reachable(indptr, indices, 0)] == [a.id, b.id, c.id, d.id]
+        assert find_path(2, 1) == [c.id, d.id, a.id, b.id]
+        assert find_path(1, 0) == []
+    chain_indptr, chain_indices = build_csr(8, array("q", range(7)), array("q", range(1, 8)))
+    chain_rev_indptr, chain_rev_indices = build_csr(8, array("q", range(1, 8)), array("q", range(7)))
+    assert list(bidir_bfs_csr(chain_indptr, chain_indices, chain_rev_indptr, chain_rev_indices, 0, 7)) == list(range(8))
+    assert list(dfs_reachable(chain_indptr, chain_indices, 5)) == [5, 6, 7]
+    assert find_path(3, 1) == [d.id, a.id, b.id]
 
 if __name__ == "__main__":
-    with Session(test_engine) as session:
+    with Session(engine) as session:
         print("\nRunning Tests...")
         run_test("Create Tree and Version", test_create_tree_and_version, session)
         run_test("Create Multiple Versions", test_create_multiple_versions, session)
+        run_test("Get Latest Version", test_get_latest_version, session)
         run_test("Add Nodes and Edges", test_add_nodes_and_edges, session)
+        run_test("Data Round Trip", test_data_round_trip, session)
+        run_test("Add Nodes", test_add_nodes, session)
+        run_test("Add Nodes and Edges Without Commit", test_add_nodes_and_edges_without_commit, session)
         run_test("Create and Restore Tag", test_create_and_restore_tag, session)
+        run_test("Create New Version Shares Nodes and Edges", test_create_new_version_shares_nodes_and_edges, session)
+        run_test("Create New Version From Empty Tables", test_create_new_version_from_empty_tables, session)
+        run_test("Create New Version With Pending Rows", test_create_new_version_with_pending_rows, session)
+        run_test("Delete Version With Children", test_delete_version_with_children, session)
+        run_test("Upgrade DB", test_upgrade_db, session)
         run_test("Tree Traversal", test_traversal, session)
+        run_test("Traverse Subgraph", test_traverse_subgraph, session)
+        run_test("Raw Traverse", test_raw_traverse, session)
         run_test("Find Path", test_find_path, session)
+        run_test("Find Path Max Length", test_find_path_max_length, session)
+        run_test("CSR Kernels", test_csr_kernels, session)